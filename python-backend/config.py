@@ -4,6 +4,7 @@ All hyperparameters, file paths, and constants are defined here.
 """
 
 import os
+import tempfile
 
 # ──────────────────────────────────────────────
 # File / Directory Paths
@@ -20,6 +21,7 @@ for d in [DATA_DIR, MODEL_DIR, LOG_DIR]:
 MODEL_PATH = os.path.join(MODEL_DIR, "lstm_model.keras")
 SCALER_PATH = os.path.join(MODEL_DIR, "scaler.pkl")
 METRICS_PATH = os.path.join(MODEL_DIR, "metrics.json")
+WEIGHTS_PATH = os.path.join(MODEL_DIR, "lstm_weights.bin")   # Exported weights + scaler for serving
 
 # ──────────────────────────────────────────────
 # LSTM Hyperparameters
@@ -45,3 +47,9 @@ TARGET_COLUMN = "price"
 API_HOST = "0.0.0.0"
 API_PORT = 8000
 CORS_ORIGINS = ["*"]  # Adjust for production
+
+# ──────────────────────────────────────────────
+# Production Serving (serving.py)
+# ──────────────────────────────────────────────
+SERVING_MAX_DEFAULT_WORKERS = 4  # Each worker loads a full TensorFlow runtime; override with --workers
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()  # Where weight segments are published
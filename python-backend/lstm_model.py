@@ -31,20 +31,9 @@ from config import (
 # ──────────────────────────────────────────────
 # 1. Build the LSTM model
 # ──────────────────────────────────────────────
-def build_model(input_shape: tuple) -> Sequential:
-    """
-    Construct a two-layer stacked LSTM with dropout.
-
-    Parameters
-    ----------
-    input_shape : (sequence_length, num_features)
-        Shape of a single input sample.
-
-    Returns
-    -------
-    Compiled Keras Sequential model.
-    """
-    model = Sequential([
+def _build_layers(input_shape: tuple) -> Sequential:
+    """Stack the layers without compiling (shared by training and serving)."""
+    return Sequential([
         # First LSTM layer — returns sequences so the second LSTM can consume them
         Input(shape=input_shape),
         LSTM(LSTM_UNITS_1, return_sequences=True),
@@ -58,6 +47,21 @@ def build_model(input_shape: tuple) -> Sequential:
         Dense(1),
     ])
 
+
+def build_model(input_shape: tuple) -> Sequential:
+    """
+    Construct a two-layer stacked LSTM with dropout.
+
+    Parameters
+    ----------
+    input_shape : (sequence_length, num_features)
+        Shape of a single input sample.
+
+    Returns
+    -------
+    Compiled Keras Sequential model.
+    """
+    model = _build_layers(input_shape)
     model.compile(optimizer="adam", loss="mse", metrics=["mae"])
     model.summary()
     return model
@@ -121,6 +125,18 @@ def load_trained_model() -> Sequential:
     return load_model(MODEL_PATH)
 
 
+def build_inference_model(input_shape: tuple, weights: list) -> Sequential:
+    """
+    Rebuild the model from raw weight arrays for serving.
+    Skips compile/summary and runs one dummy prediction, so callers that
+    build off the request path (serving.py) hand out an already-traced model.
+    """
+    model = _build_layers(input_shape)
+    model.set_weights(weights)
+    predict(model, np.zeros((1, *input_shape), dtype="float32"))
+    return model
+
+
 # ──────────────────────────────────────────────
 # 4. Predict
 # ──────────────────────────────────────────────
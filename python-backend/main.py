@@ -31,6 +31,7 @@ from config import (
 from data_preprocessing import prepare_dataset, load_scaler, normalise_data, create_sequences, load_data, clean_data
 from lstm_model import build_model, train_model, load_trained_model, predict
 from evaluation import compute_metrics
+from serving import export_weights, get_worker_artifacts, request_reload
 
 # ──────────────────────────────────────────────
 # Logging
@@ -145,7 +146,8 @@ async def train_endpoint(req: TrainRequest):
       2. Build LSTM architecture
       3. Train with early stopping
       4. Evaluate on held-out test set
-      5. Return metrics
+      5. Export weights for the serving launcher
+      6. Return metrics
     """
     file_path = os.path.join(DATA_DIR, req.filename)
     if not os.path.exists(file_path):
@@ -180,6 +182,14 @@ async def train_endpoint(req: TrainRequest):
         metrics = compute_metrics(y_test_real, y_pred_real)
         logger.info(f"Training complete — metrics: {metrics}")
 
+        # 5 — Export weights for the serving launcher and swap them into all workers.
+        # The model is already saved, so a failure here must not fail the training run.
+        try:
+            export_weights(model, scaler)
+            request_reload()
+        except Exception as e:
+            logger.error(f"Weight export failed — serving workers keep their current weights: {e}", exc_info=True)
+
         return TrainResponse(
             message="Model trained successfully",
             metrics=metrics,
@@ -201,10 +211,16 @@ async def predict_endpoint(req: PredictRequest):
     The client sends the last `sequence_length` days of features.
     """
     try:
-        model = load_trained_model()
-        scaler = load_scaler()
+        # Under serving.py the weights come from the shared segment
+        artifacts = get_worker_artifacts()
+        if artifacts is None:
+            artifacts = load_trained_model(), load_scaler()
+        model, scaler = artifacts
     except FileNotFoundError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Loading model failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
 
     # Validate input shape
     if len(req.sequence) != SEQUENCE_LENGTH:
@@ -265,6 +281,7 @@ async def metrics_endpoint():
 # Entry point
 # ──────────────────────────────────────────────
 if __name__ == "__main__":
+    # Development server — use `python serving.py` for multi-worker production serving
     import uvicorn
     logger.info(f"Starting AgriPrice API on {API_HOST}:{API_PORT}")
     uvicorn.run("main:app", host=API_HOST, port=API_PORT, reload=True)
@@ -0,0 +1,575 @@
+"""
+Production Serving Module
+─────────────────────────
+Preforked multi-worker launcher for the AgriPrice API.
+
+The parent process never imports TensorFlow. It copies the exported
+weights file (written after every training run) into a segment in a
+private directory under SHM_DIR, binds the listening socket, and forks
+the uvicorn workers. Each worker pins itself to its own slice of CPUs,
+caps its TensorFlow / BLAS thread pools, and builds its model from the
+segment. A background thread in every worker swaps in newly published
+generations, so requests never wait on a rebuild.
+
+Memory: every worker still imports its own TensorFlow runtime, copies
+the weights into its own Keras variables and unpickles its own scaler,
+so per-worker memory is the same as running N copies of main.py. The
+segment is only how one validated copy of the weights reaches every
+worker at startup and on reload — workers do not share it while serving.
+
+Usage:
+  python serving.py --workers 4
+  kill -HUP <parent pid>     → publish new weights to every worker
+
+Segment layout:
+  [8-byte header length][JSON header][pad → 64][weight arrays ...][scaler pickle]
+"""
+
+import argparse
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import pickle
+import shutil
+import signal
+import socket
+import struct
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    API_HOST,
+    API_PORT,
+    MODEL_PATH,
+    WEIGHTS_PATH,
+    SERVING_MAX_DEFAULT_WORKERS,
+    SHM_DIR,
+)
+
+logger = logging.getLogger(__name__)
+
+_HEADER_LEN = struct.Struct("<Q")
+_ALIGN = 64
+
+# How often workers check for new weights and for a dead launcher
+_POLL_SECONDS = 0.5
+
+# Crash-loop protection for workers that die right after starting
+_QUICK_EXIT_SECONDS = 10
+_MAX_QUICK_FAILURES = 5
+_MAX_BACKOFF_SECONDS = 30
+
+# How long workers get to finish in-flight requests before SIGKILL
+_SHUTDOWN_GRACE_SECONDS = 30
+
+# Thread-pool knobs honoured by TensorFlow, OpenMP and the BLAS backends
+_THREAD_ENV_VARS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"]
+
+# Worker-side state — only set inside forked workers
+_generation = None            # multiprocessing.Value shared with the parent
+_launcher_pid: Optional[int] = None
+_segment_prefix: Optional[str] = None
+_cached = None                # (generation, model, scaler) — replaced as a whole
+_failed_generation = 0        # last generation that could not be loaded
+
+
+def _align(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _segment_path(prefix: str, generation: int) -> str:
+    return f"{prefix}-{generation}.bin"
+
+
+def _discard(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+# ──────────────────────────────────────────────
+# 1. Weights segment format
+# ──────────────────────────────────────────────
+def export_weights(model, scaler, path: str = WEIGHTS_PATH) -> str:
+    """
+    Write the model weights and fitted scaler into one flat file that
+    the serving parent can copy straight into shared memory.
+    """
+    import numpy as np
+
+    arrays = [np.ascontiguousarray(w, dtype="float32") for w in model.get_weights()]
+    scaler_bytes = pickle.dumps(scaler)
+
+    entries, offset = [], 0
+    for arr in arrays:
+        entries.append({
+            "shape": list(arr.shape),
+            "dtype": str(arr.dtype),
+            "offset": offset,
+            "nbytes": arr.nbytes,
+        })
+        offset = _align(offset + arr.nbytes)
+    header = json.dumps({
+        "input_shape": list(model.input_shape[1:]),
+        "arrays": entries,
+        "scaler": {"offset": offset, "length": len(scaler_bytes)},
+    }).encode()
+    payload_start = _align(_HEADER_LEN.size + len(header))
+
+    # Unique temp file — several workers may finish training at once
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER_LEN.pack(len(header)))
+            f.write(header)
+            for entry, arr in zip(entries, arrays):
+                f.seek(payload_start + entry["offset"])
+                f.write(arr.tobytes())
+            f.seek(payload_start + offset)
+            f.write(scaler_bytes)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+    return path
+
+
+def _read_header(buf) -> Tuple[dict, int]:
+    """Return the JSON header and the offset where the payload starts."""
+    (length,) = _HEADER_LEN.unpack_from(buf, 0)
+    header = json.loads(bytes(buf[_HEADER_LEN.size:_HEADER_LEN.size + length]))
+    return header, _align(_HEADER_LEN.size + length)
+
+
+def validate_segment(buf) -> dict:
+    """
+    Check that every array and the scaler lie inside the segment.
+    Raises ValueError for a truncated or malformed file; returns the header.
+    """
+    try:
+        header, start = _read_header(buf)
+        ranges = [(entry["offset"], entry["nbytes"]) for entry in header["arrays"]]
+        ranges.append((header["scaler"]["offset"], header["scaler"]["length"]))
+    except (struct.error, KeyError, TypeError) as e:
+        raise ValueError(f"malformed weights header: {e!r}") from None
+
+    for offset, length in ranges:
+        end = start + offset + length
+        if offset < 0 or length < 0 or end > len(buf):
+            raise ValueError(f"weights file truncated: needs {end} bytes, has {len(buf)}")
+    return header
+
+
+def attach_segment(path: str):
+    """
+    Map a weights segment read-only.
+    Returns (input_shape, weight arrays, scaler). The arrays are views
+    over the mapping — no copy is made.
+    """
+    import numpy as np
+
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header = validate_segment(mm)
+    _, start = _read_header(mm)
+
+    arrays = []
+    for entry in header["arrays"]:
+        count = int(np.prod(entry["shape"]))
+        arr = np.frombuffer(mm, dtype=entry["dtype"], count=count, offset=start + entry["offset"])
+        arrays.append(arr.reshape(entry["shape"]))
+
+    s = header["scaler"]
+    scaler = pickle.loads(mm[start + s["offset"]:start + s["offset"] + s["length"]])
+    return tuple(header["input_shape"]), arrays, scaler
+
+
+# ──────────────────────────────────────────────
+# 2. Worker side
+# ──────────────────────────────────────────────
+def get_worker_artifacts():
+    """
+    Return (model, scaler) for the generation this worker has loaded, or
+    None when not running under the prefork launcher (dev mode).
+    Never builds on the request path — swaps happen in _watch_launcher.
+    """
+    if _generation is None:
+        return None
+
+    cached = _cached
+    if cached is None:
+        if _generation.value == 0:
+            raise FileNotFoundError(
+                "No trained model has been published yet. "
+                "Please train the model first via POST /train-model."
+            )
+        raise RuntimeError("Published model weights could not be loaded — check the server logs.")
+    return cached[1], cached[2]
+
+
+def _refresh_model() -> None:
+    """Load the latest published generation if it is new; keep the current one on failure."""
+    global _cached, _failed_generation
+
+    generation = _generation.value
+    if generation == 0 or generation == _failed_generation:
+        return
+    if _cached is not None and _cached[0] == generation:
+        return
+
+    from lstm_model import build_inference_model
+
+    try:
+        input_shape, arrays, scaler = attach_segment(_segment_path(_segment_prefix, generation))
+        model = build_inference_model(input_shape, arrays)
+    except Exception:
+        if _generation.value != generation:
+            return  # superseded (and possibly pruned) — the next poll loads the newest one
+        current = _cached[0] if _cached is not None else None
+        logger.exception(
+            f"Worker {os.getpid()} could not load weights generation {generation} — "
+            f"keeping generation {current}"
+        )
+        _failed_generation = generation
+        return
+
+    _cached = (generation, model, scaler)
+    logger.info(f"Worker {os.getpid()} swapped in weights generation {generation}")
+
+
+def request_reload() -> None:
+    """Ask the launcher to publish freshly exported weights. No-op in dev mode."""
+    if _generation is None:
+        return
+    # An orphaned worker's parent is init or a subreaper — never signal that
+    if os.getppid() != _launcher_pid:
+        logger.warning("Launcher is gone — not requesting a weights reload")
+        return
+    try:
+        os.kill(_launcher_pid, signal.SIGHUP)
+    except OSError as e:
+        logger.warning(f"Could not signal launcher {_launcher_pid} for reload: {e}")
+
+
+def _watch_launcher(launcher_pid: int) -> None:
+    """
+    Background thread: swap in new weight generations off the request
+    path, and shut the worker down gracefully once the launcher has died.
+    """
+    while os.getppid() == launcher_pid:
+        _refresh_model()
+        time.sleep(_POLL_SECONDS)
+    logger.warning(f"Launcher {launcher_pid} exited — stopping worker {os.getpid()}")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def _run_worker(
+    sock: socket.socket,
+    cpus: List[int],
+    threads: int,
+    generation,
+    prefix: str,
+    launcher_pid: int,
+) -> None:
+    """Configure CPU affinity and thread limits, then serve on the shared socket."""
+    global _generation, _segment_prefix, _launcher_pid
+
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    # Must be set before TensorFlow / numpy spin up their thread pools
+    for var in _THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+
+    _generation, _segment_prefix, _launcher_pid = generation, prefix, launcher_pid
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    # Load the current generation before accepting any requests
+    _refresh_model()
+    threading.Thread(target=_watch_launcher, args=(launcher_pid,), daemon=True).start()
+
+    import uvicorn
+    logger.info(f"Worker {os.getpid()} serving on CPUs {cpus} with {threads} thread(s)")
+    uvicorn.Server(uvicorn.Config("main:app", log_level="info")).run(sockets=[sock])
+
+
+# ──────────────────────────────────────────────
+# 3. Parent side
+# ──────────────────────────────────────────────
+def _export_from_saved_model() -> None:
+    """Export weights from the saved .keras model (runs in a spawned child)."""
+    from lstm_model import load_trained_model
+    from data_preprocessing import load_scaler
+
+    export_weights(load_trained_model(), load_scaler())
+
+
+def _ensure_exported() -> bool:
+    """
+    Make sure WEIGHTS_PATH exists and is not older than the saved model.
+    Returns False when there is nothing to publish; raises RuntimeError
+    if exporting from the saved model fails.
+    """
+    if not os.path.exists(MODEL_PATH):
+        return os.path.exists(WEIGHTS_PATH)
+    if os.path.exists(WEIGHTS_PATH) and os.path.getmtime(WEIGHTS_PATH) >= os.path.getmtime(MODEL_PATH):
+        return True
+
+    # Spawn (not fork) so TensorFlow is never loaded into the parent
+    logger.info(f"Exporting weights from {MODEL_PATH}")
+    proc = multiprocessing.get_context("spawn").Process(target=_export_from_saved_model)
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        raise RuntimeError(f"exporting weights from {MODEL_PATH} failed (exit code {proc.exitcode})")
+    return True
+
+
+class PreforkServer:
+    """Parent process: owns the socket, the weights segments and the workers."""
+
+    def __init__(self, host: str, port: int, workers: Optional[int] = None, threads_per_worker: int = 0):
+        self.host = host
+        self.port = port
+
+        if hasattr(os, "sched_getaffinity"):
+            cpus = sorted(os.sched_getaffinity(0))
+        else:
+            cpus = list(range(os.cpu_count() or 1))
+        self.num_workers = max(1, workers or min(len(cpus), SERVING_MAX_DEFAULT_WORKERS))
+        self.threads = threads_per_worker or max(1, len(cpus) // self.num_workers)
+        if self.num_workers * self.threads > len(cpus):
+            logger.warning(
+                f"{self.num_workers} workers × {self.threads} thread(s) exceeds the "
+                f"{len(cpus)} available CPUs — workers will share cores"
+            )
+        # Contiguous CPU slices, wrapping only when oversubscribed
+        self.cpu_slices = [
+            sorted({cpus[(i * self.threads + j) % len(cpus)] for j in range(self.threads)})
+            for i in range(self.num_workers)
+        ]
+
+        self.segment_dir: Optional[str] = None     # private 0700 dir, created in run()
+        self.prefix: Optional[str] = None
+        self.generation = multiprocessing.Value("L", 0, lock=False)
+        self.published: List[int] = []
+        self.workers: Dict[int, int] = {}          # pid → worker index
+        self.started: Dict[int, float] = {}        # worker index → start time
+        self.quick_failures: Dict[int, int] = {}   # worker index → consecutive quick exits
+        self.respawn_at: Dict[int, float] = {}     # worker index → scheduled restart time
+        self._reload_requested = False
+        self._stopping = False
+
+    # ── weights ──
+    def publish(self) -> None:
+        """
+        Copy the exported weights into a new shared-memory generation.
+        Any failure is logged and the current generation keeps serving.
+        """
+        current = self.generation.value
+        generation = current + 1
+        path = _segment_path(self.prefix, generation)
+        tmp_path = None
+        try:
+            if not _ensure_exported():
+                logger.warning("No exported weights to publish — train the model first")
+                return
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.segment_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as dst, open(WEIGHTS_PATH, "rb") as src:
+                shutil.copyfileobj(src, dst)
+            with open(tmp_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                validate_segment(mm)
+            os.replace(tmp_path, path)
+        except (OSError, RuntimeError, ValueError) as e:
+            if tmp_path is not None:
+                _discard(tmp_path)
+            logger.error(f"Failed to publish weights generation {generation}, keeping generation {current}: {e}")
+            return
+
+        self.generation.value = generation
+        self.published.append(generation)
+        # Keep the previous generation for workers that are mid-swap
+        while len(self.published) > 2:
+            old = self.published.pop(0)
+            try:
+                os.unlink(_segment_path(self.prefix, old))
+            except OSError as e:
+                logger.warning(f"Could not remove weights generation {old}: {e}")
+        logger.info(f"Published weights generation {generation} at {path}")
+
+    # ── workers ──
+    def _spawn(self, index: int, sock: socket.socket) -> None:
+        launcher_pid = os.getpid()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(
+                    sock, self.cpu_slices[index], self.threads, self.generation, self.prefix, launcher_pid
+                )
+            except BaseException:
+                logger.exception(f"Worker {index} crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = index
+        self.started[index] = time.monotonic()
+
+    def _reap(self) -> None:
+        """Collect exited workers and schedule restarts with exponential backoff."""
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            index = self.workers.pop(pid, None)
+            if index is None or self._stopping:
+                continue
+
+            if time.monotonic() - self.started[index] < _QUICK_EXIT_SECONDS:
+                self.quick_failures[index] = self.quick_failures.get(index, 0) + 1
+            else:
+                self.quick_failures[index] = 0
+            failures = self.quick_failures[index]
+
+            if failures >= _MAX_QUICK_FAILURES:
+                logger.error(
+                    f"Worker {index} exited {failures} times within {_QUICK_EXIT_SECONDS}s of starting "
+                    "— stopping the launcher"
+                )
+                self._stopping = True
+                return
+
+            delay = min(_MAX_BACKOFF_SECONDS, 0.5 * 2 ** failures) if failures else 0
+            logger.warning(
+                f"Worker {index} (pid {pid}) exited with status {status} — restarting in {delay:.1f}s"
+            )
+            self.respawn_at[index] = time.monotonic() + delay
+
+    def _respawn_due(self, sock: socket.socket) -> None:
+        now = time.monotonic()
+        for index, at in list(self.respawn_at.items()):
+            if now >= at:
+                del self.respawn_at[index]
+                self._spawn(index, sock)
+
+    def _shutdown(self) -> None:
+        """Stop workers gracefully, SIGKILL stragglers, and remove the segments."""
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + _SHUTDOWN_GRACE_SECONDS
+        while self.workers and time.monotonic() < deadline:
+            for pid in list(self.workers):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    del self.workers[pid]
+            time.sleep(0.1)
+
+        for pid in list(self.workers):
+            logger.warning(f"Worker pid {pid} did not stop within {_SHUTDOWN_GRACE_SECONDS}s — killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.workers.clear()
+
+        if self.segment_dir is not None:
+            shutil.rmtree(self.segment_dir, ignore_errors=True)
+
+    def _on_stop(self, *_):
+        self._stopping = True
+
+    def _on_reload(self, *_):
+        self._reload_requested = True
+
+    def run(self) -> None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+
+        # Installed before the first publish, which may run a slow export
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGTERM, self._on_stop)
+
+        try:
+            # Private (0700) directory so no other user can plant a segment the workers unpickle
+            self.segment_dir = tempfile.mkdtemp(prefix="agriprice-", dir=SHM_DIR)
+            self.prefix = os.path.join(self.segment_dir, "weights")
+            self.publish()
+            if self._stopping:
+                return
+
+            logger.info(
+                f"Starting AgriPrice API on {self.host}:{self.port} — "
+                f"{self.num_workers} workers × {self.threads} thread(s), parent pid {os.getpid()}"
+            )
+            for index in range(self.num_workers):
+                self._spawn(index, sock)
+
+            while not self._stopping:
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self.publish()
+                self._reap()
+                self._respawn_due(sock)
+                time.sleep(0.5)
+        finally:
+            self._shutdown()
+            sock.close()
+
+
+def main() -> None:
+    # String defaults from the environment go through `type=int`, so bad values get a usage error
+    parser = argparse.ArgumentParser(description="Preforked multi-worker AgriPrice API server")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.environ.get("AGRIPRICE_WORKERS"),
+        help=f"Worker processes (default: $AGRIPRICE_WORKERS or min(available CPUs, {SERVING_MAX_DEFAULT_WORKERS}))",
+    )
+    parser.add_argument(
+        "--threads-per-worker",
+        type=int,
+        default=os.environ.get("AGRIPRICE_THREADS_PER_WORKER", "0"),
+        help="TensorFlow/BLAS threads per worker (default: $AGRIPRICE_THREADS_PER_WORKER or available CPUs ÷ workers)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+    )
+    PreforkServer(args.host, args.port, args.workers, args.threads_per_worker).run()
+
+
+# ──────────────────────────────────────────────
+# Entry point
+# ──────────────────────────────────────────────
+if __name__ == "__main__":
+    # Re-import as `serving` so main.py sees the same worker globals
+    import serving
+    serving.main()
@@ -0,0 +1,143 @@
+"""
+Tests for the serving weights segment and launcher bookkeeping.
+Only need the standard library and numpy — no TensorFlow, no workers.
+
+Run:  python -m pytest test_serving.py   (or python -m unittest test_serving)
+"""
+
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import serving
+
+
+class FakeModel:
+    """Just enough of a Keras model for export_weights."""
+    input_shape = (None, 30, 3)
+
+    def __init__(self):
+        rng = np.random.default_rng(0)
+        self.weights = [
+            rng.random((3, 256), dtype="float32"),
+            rng.random((64, 256), dtype="float32"),
+            rng.random((256,), dtype="float32"),
+            rng.random((128, 1), dtype="float32"),
+            np.zeros((1,), dtype="float32"),
+        ]
+
+    def get_weights(self):
+        return self.weights
+
+
+class SegmentFormatTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "lstm_weights.bin")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        model = FakeModel()
+        serving.export_weights(model, {"min": [0.0, 1.0]}, self.path)
+
+        input_shape, arrays, scaler = serving.attach_segment(self.path)
+
+        self.assertEqual(input_shape, (30, 3))
+        self.assertEqual(scaler, {"min": [0.0, 1.0]})
+        self.assertEqual(len(arrays), len(model.weights))
+        for got, expected in zip(arrays, model.weights):
+            np.testing.assert_array_equal(got, expected)
+            self.assertFalse(got.flags.writeable)
+        self.assertEqual(os.listdir(self.tmp.name), ["lstm_weights.bin"])
+
+    def test_truncated_file_is_rejected(self):
+        serving.export_weights(FakeModel(), {}, self.path)
+        with open(self.path, "rb") as f:
+            data = f.read()
+
+        serving.validate_segment(data)
+        with self.assertRaises(ValueError):
+            serving.validate_segment(data[:4096])
+        with self.assertRaises(ValueError):
+            serving.validate_segment(b"")
+
+
+class PublishTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.weights_path = os.path.join(self.tmp.name, "lstm_weights.bin")
+        self.segment_dir = os.path.join(self.tmp.name, "segments")
+        os.mkdir(self.segment_dir)
+
+        patches = [
+            mock.patch.object(serving, "WEIGHTS_PATH", self.weights_path),
+            mock.patch.object(serving, "MODEL_PATH", os.path.join(self.tmp.name, "missing.keras")),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+        self.server = serving.PreforkServer("127.0.0.1", 0, workers=1, threads_per_worker=1)
+        self.server.segment_dir = self.segment_dir
+        self.server.prefix = os.path.join(self.segment_dir, "weights")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_publish_then_reject_truncated(self):
+        serving.export_weights(FakeModel(), {}, self.weights_path)
+        self.server.publish()
+        self.assertEqual(self.server.generation.value, 1)
+
+        with open(self.weights_path, "r+b") as f:
+            f.truncate(4096)
+        self.server.publish()
+
+        self.assertEqual(self.server.generation.value, 1)
+        self.assertEqual(os.listdir(self.segment_dir), ["weights-1.bin"])
+        serving.attach_segment(serving._segment_path(self.server.prefix, 1))
+
+    def test_nothing_to_publish(self):
+        self.server.publish()
+        self.assertEqual(self.server.generation.value, 0)
+        self.assertEqual(os.listdir(self.segment_dir), [])
+
+
+class ReapTest(unittest.TestCase):
+    def test_crash_loop_stops_launcher(self):
+        server = serving.PreforkServer("127.0.0.1", 0, workers=1, threads_per_worker=1)
+
+        for attempt in range(1, serving._MAX_QUICK_FAILURES + 1):
+            server.workers = {1000 + attempt: 0}
+            server.started[0] = time.monotonic()
+            with mock.patch.object(serving.os, "waitpid", side_effect=[(1000 + attempt, 256), (0, 0)]):
+                server._reap()
+            self.assertEqual(server.quick_failures[0], attempt)
+
+            if attempt < serving._MAX_QUICK_FAILURES:
+                self.assertFalse(server._stopping)
+                self.assertGreater(server.respawn_at.pop(0), time.monotonic())
+        self.assertTrue(server._stopping)
+
+    def test_long_running_worker_restarts_immediately(self):
+        server = serving.PreforkServer("127.0.0.1", 0, workers=1, threads_per_worker=1)
+        server.workers = {1234: 0}
+        server.started[0] = time.monotonic() - serving._QUICK_EXIT_SECONDS - 1
+        server.quick_failures[0] = 3
+
+        with mock.patch.object(serving.os, "waitpid", side_effect=[(1234, 256), (0, 0)]):
+            server._reap()
+
+        self.assertEqual(server.quick_failures[0], 0)
+        self.assertLessEqual(server.respawn_at[0], time.monotonic())
+        self.assertFalse(server._stopping)
+
+
+if __name__ == "__main__":
+    unittest.main()